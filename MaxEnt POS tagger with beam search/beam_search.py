@@ -6,7 +6,8 @@ test_data = sys.argv[1] (one word and its vector of features and values per line
     <word> <true_pos> <feat1> <val1> <feat2> <val2> ...
     1-0-The DT curW=The 1 prevW=BOS 1 prev2W=BOS 1 nextW=Arizona 1
 boundary_file = sys.argv[2] (one number per line: number of words in each sentence in test_data)
-model_file = sys.argv[3] (maxent model parameters)
+model_file = sys.argv[3] (maxent model parameters, or a compressed .npz model written by compress_model.py)
+    Either is loaded as a SparseModel; a compressed model keeps its pruned weights at their stored precision in memory
     FEATURES FOR CLASS NNP
     <default> 3.7912278052488615
     curW=Pierre 1.0055824571891294
@@ -29,8 +30,6 @@ topK = sys.argv[7]
 import sys
 import re
 from collections import defaultdict
-from math import exp
-import copy
 import math
 import numpy as np
 
@@ -53,45 +52,135 @@ def get_model_weights(file_name):
     return weights, list(weights.keys())
 
 
-def get_top_n(classes_to_exponents, n, classes):
+def get_weights_by_feature(model_weights, classes):
+    """
+    Turn {class : {feat:weight...}} into {feat : [(class_id, weight)...]} sorted by class_id, leaving out <default>
+    :param model_weights: {class : {feat:weight, feat:weight...}} as returned by get_model_weights
+    :param classes: all POS classes present in MaxEnt model file
+    """
+    by_feature = defaultdict(list)
+    for class_id, cla in enumerate(classes):
+        for feat, weight in model_weights[cla].items():
+            if feat != "<default>":
+                by_feature[feat].append((class_id, weight))
+    return by_feature
+
+
+class SparseModel:
+    """
+    MaxEnt model weights in sparse feature x class layout, as stored in .npz files written by compress_model.py:
+        classes: POS class names
+        defaults: <default> weight per class
+        features: feature names
+        indptr: weights for features[i] are at positions indptr[i]:indptr[i + 1] of class_ids and values
+        class_ids: index into classes for each stored weight
+        values: stored weights (float64 for a full model, float32 or float16 for a compressed one)
+    Weights stay in numpy arrays at their stored precision, so both pruning and reduced precision make the loaded
+    model smaller. Scoring a word only visits the weights stored for its features.
+    """
+
+    def __init__(self, classes, defaults, features, indptr, class_ids, values):
+        self.classes = list(classes)
+        self.defaults = np.asarray(defaults, dtype=np.float64)
+        self.feature_ids = {feat: i for i, feat in enumerate(features)}
+        self.indptr = list(indptr)  # python ints are faster to index than numpy ones
+        self.class_ids = np.asarray(class_ids)
+        self.values = np.asarray(values)
+
+    @classmethod
+    def from_weights(cls, by_feature, defaults, classes, dtype):
+        """
+        Build a model from {feat : [(class_id, weight)...]}, storing feature weights as dtype
+        :param by_feature: {feat : [(class_id, weight)...]} sorted by class_id
+        :param defaults: <default> weight per class
+        :param classes: all POS classes present in MaxEnt model file
+        :param dtype: numpy dtype to store the feature weights as
+        """
+        features = sorted(by_feature.keys())
+        indptr = [0]
+        class_ids = []
+        values = []
+        for feat in features:
+            for class_id, weight in by_feature[feat]:
+                class_ids.append(class_id)
+                values.append(weight)
+            indptr.append(len(values))
+
+        id_type = np.uint8 if len(classes) <= 256 else np.uint16
+        with np.errstate(over="ignore"):  # callers that care check for overflow with np.isfinite
+            return cls(classes, defaults, features, indptr, np.array(class_ids, dtype=id_type),
+                       np.array(values, dtype=dtype))
+
+    def add_weights(self, exponents, list_of_features):
+        """
+        Add the weights of each feature in list_of_features to exponents, a vector with one entry per class
+        """
+        class_ids = []
+        values = []
+        for feature in list_of_features:
+            i = self.feature_ids.get(feature)
+            if i is not None:
+                start, end = self.indptr[i], self.indptr[i + 1]
+                class_ids.append(self.class_ids[start:end])
+                values.append(self.values[start:end])
+
+        # one bincount over all the features is much cheaper than one fancy-indexed += per feature
+        if class_ids:
+            exponents += np.bincount(np.concatenate(class_ids), np.concatenate(values), len(self.classes))
+
+    def save(self, file_name, defaults_dtype=np.float32):
+        """
+        Write the model to an .npz file, with <default> weights stored as defaults_dtype
+        """
+        np.savez(file_name,
+                 classes=np.array(self.classes),
+                 defaults=self.defaults.astype(defaults_dtype),
+                 features=np.array(list(self.feature_ids.keys())),
+                 indptr=np.array(self.indptr, dtype=np.int32),
+                 class_ids=self.class_ids,
+                 values=self.values)
+
+
+def load_model(file_name):
+    """
+    Load a model file (text, as read by get_model_weights, or a compressed .npz) as a SparseModel
+    A text model keeps its weights at full (float64) precision
+    """
+    if file_name.endswith(".npz"):
+        with np.load(file_name) as model:
+            return SparseModel(model["classes"].tolist(), model["defaults"], model["features"].tolist(),
+                               model["indptr"].tolist(), model["class_ids"], model["values"])
+
+    model_weights, classes = get_model_weights(file_name)
+    defaults = [model_weights[cla]["<default>"] for cla in classes]
+    return SparseModel.from_weights(get_weights_by_feature(model_weights, classes), defaults, classes, np.float64)
+
+
+def get_top_n(exponents, n, classes):
     """
     Calculate P(POS class | word) for each POS class and a given word using MaxEnt model and return top N classes
-    :param classes_to_exponents: dictionary of {class --> summation of feature weights for given word}
+    :param exponents: vector of summation of feature weights for given word, one entry per class
     :param: n: max number of possible classes to keep per word
     :param: classes: all POS classes present in MaxEnt model file
     :return: a list of (prob, tag) tuples, sorted by probability in decreasing order, of length n
     """
 
-    # calculate denominator: sum of all numerators
-    Z = 0
-    numerators = {}
-    for cl, exponent in classes_to_exponents.items():
-        numerators[cl] = exp(exponent)
-        Z += numerators[cl]
-
-    probs = []  # list of tuples (P(tag|word), tag)
-
-    for c in classes:
-        probs.append(tuple([numerators[c] / Z, c]))
+    # denominator is the sum of all numerators
+    numerators = np.exp(exponents)
+    probs = (numerators / numerators.sum()).tolist()
 
-    return sorted(probs, reverse=True)[:n]
+    return sorted(zip(probs, classes), reverse=True)[:n]
 
 
-def get_exponent_sums(list_of_features, model_weights, classes):
+def get_exponent_sums(list_of_features, model):
     """
-    take a list of features, return a dictionary of feature weight summations per class
+    take a list of features, return a vector of feature weight summations per class
     :param: list_of_features:
-    :param: model_weights:
-    :param: classes: all POS classes present in MaxEnt model file
+    :param: model: SparseModel
     """
 
-    powers = {}
-    for t in classes:
-        pow = model_weights[t]['<default>']  # start the exponent-to-be at the default weight for the current class
-        for feature in list_of_features:
-            pow += model_weights[t].get(feature, 0)
-        powers[t] = pow
-
+    powers = model.defaults.copy()  # start the exponents-to-be at the default weight for each class
+    model.add_weights(powers, list_of_features)
     return powers
 
 
@@ -118,27 +207,32 @@ def max_pathprob(node_list):
     return max_p
 
 
-def main():
-    beam_size = int(sys.argv[5])
-    n = int(sys.argv[6])
-    top_k = int(sys.argv[7])
-
+def tag_file(test_file, boundary_file_name, model, sys_output, beam_size, n, top_k):
+    """
+    Tag every sentence in test_file with beam search and return the accuracy against the true tags
+    :param test_file: one word and its vector of features and values per line
+    :param boundary_file_name: one number per line: number of words in each sentence in test_file
+    :param model: SparseModel as returned by load_model
+    :param sys_output: filename to write predictions to, or None to skip writing them
+    :param beam_size: prune paths whose prob is not within beam_size of prob of most probable path
+    :param n: max number of possible classes to keep per word
+    :param top_k: max number of paths to keep at each time step
+    :return: proportion of words tagged correctly
+    """
+    classes = model.classes
     true_tag_by_id = []
     predicted_tag_by_id = []
 
-    # get model weights and list of classes
-    # ex.: {NNP: {"curW=Pierre":1.0055824571891294, "prevW=BOS":0.15158438156724433}}
-    model_weights, classes = get_model_weights(sys.argv[3])
-
     # store list of test sentence lengths
-    with open(sys.argv[2], 'r') as boundary_file:
+    with open(boundary_file_name, 'r') as boundary_file:
         boundaries = [int(line) for line in boundary_file.readlines()]
 
     # clear sys_output file in case it's been written to before
-    open(sys.argv[4], 'w')
+    if sys_output is not None:
+        open(sys_output, 'w').close()
 
     # PROCESS TEST DATA
-    with open(sys.argv[1], 'r') as test_data:
+    with open(test_file, 'r') as test_data:
         for sentence_length in boundaries:  # each sentence in test data
             # dict representation of tree of all possible tag sequences
             # key: word in the sentence
@@ -158,7 +252,7 @@ def main():
             first_features = first_word_split[2::2]
             first_features.append("prevT=BOS")
             first_features.append("prevTwoTags=BOS+BOS")
-            first_exponents = get_exponent_sums(first_features, model_weights, classes)
+            first_exponents = get_exponent_sums(first_features, model)
             first_top_n = get_top_n(first_exponents, n, classes)
 
             # make node for each top_n tag for first word
@@ -186,7 +280,7 @@ def main():
 
                 # for maxent calculation
                 # get weight summation per class for all features so far (same for all nodes, regardless of parent)
-                curr_exponents = get_exponent_sums(curr_features, model_weights, classes)
+                curr_exponents = get_exponent_sums(curr_features, model)
 
                 all_curr_nodes = []
 
@@ -203,10 +297,8 @@ def main():
                         prev_two_tags = "prevTwoTags=" + parent_node.parent.tag + "+" + parent_node.tag
 
                     # finish exponent summation (add prev_tag features) per class (add to COPY of curr_exponents)
-                    this_parent_exponents = copy.deepcopy(curr_exponents)
-                    for clss in classes:
-                        this_parent_exponents[clss] += model_weights[clss].get(prev_tag, 0)
-                        this_parent_exponents[clss] += model_weights[clss].get(prev_two_tags, 0)
+                    this_parent_exponents = curr_exponents.copy()
+                    model.add_weights(this_parent_exponents, [prev_tag, prev_two_tags])
 
                     # get top_n tags for current word
                     curr_top_n = get_top_n(this_parent_exponents, n, classes)
@@ -242,25 +334,28 @@ def main():
                                                                    current_node.tag, current_node.tag_prob))
                 predicted_tags_this_sent.append(current_node.tag)
                 current_node = current_node.parent
-            with open(sys.argv[4], 'a') as sys_file:
-                while sys_output_lines:
-                    predicted_tag_by_id.append(predicted_tags_this_sent.pop())
-                    sys_file.write(sys_output_lines.pop())
-
-    # calculate and print accuracy across all sentences
+            while predicted_tags_this_sent:
+                predicted_tag_by_id.append(predicted_tags_this_sent.pop())
+            if sys_output is not None:
+                with open(sys_output, 'a') as sys_file:
+                    while sys_output_lines:
+                        sys_file.write(sys_output_lines.pop())
+
+    # calculate accuracy across all sentences
     predicted_tag_by_id = np.array(predicted_tag_by_id)
     true_tag_by_id = np.array(true_tag_by_id)
-    print(np.mean(predicted_tag_by_id == true_tag_by_id))
-
-    # # DEBUGGING - print tree
-    # for word_posit in range(len(tree)):
-    #     for nod in tree[word_posit]:
-    #         print(str(word_posit) + " " + str(nod))
-    #         if nod.parent and nod.parent.word and nod.parent.tag:
-    #             print("parent: " + nod.parent.word + " " + nod.parent.tag)
-    #
-    # print("predicted tags")
-    # print(predicted_tag_by_id)
+    return np.mean(predicted_tag_by_id == true_tag_by_id)
+
+
+def main():
+    beam_size = int(sys.argv[5])
+    n = int(sys.argv[6])
+    top_k = int(sys.argv[7])
+
+    # get model weights and list of classes
+    model = load_model(sys.argv[3])
+
+    print(tag_file(sys.argv[1], sys.argv[2], model, sys.argv[4], beam_size, n, top_k))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,186 @@
+"""
+Compress a MaxEnt model for beam_search.py by pruning small weights and storing the rest at reduced precision,
+then compare the compressed model against the full model on a test file.
+
+INPUTS
+model_file = sys.argv[1] (maxent model parameters in the text format read by beam_search.get_model_weights)
+compressed_file = sys.argv[2] (where to write the compressed model; .npz is appended if missing)
+threshold = sys.argv[3]
+    Drop weights whose absolute value is below <threshold> (0 to keep all)
+top_m = sys.argv[4]
+    Keep only the <top_m> largest weights (by absolute value) for each feature (0 to keep all)
+precision = sys.argv[5]
+    float32 or float16. beam_search.py keeps weights at this precision in memory too
+test_data = sys.argv[6] (same format as beam_search.py)
+boundary_file = sys.argv[7] (same format as beam_search.py)
+beam_size = sys.argv[8]
+topN = sys.argv[9]
+topK = sys.argv[10]
+
+<default> weights are never pruned and are always stored as float32.
+Prints number of weights kept, file size, load time, accuracy and decode time for the full and compressed models.
+Load and decode times are the median of TIMING_REPEATS runs, taken after one untimed warm-up decode per model;
+spread is (slowest - fastest) / median decode time, so speed-ups smaller than it are noise.
+Both models are loaded with beam_search.load_model and decoded as a SparseModel (the full one at float64), so the
+decode speed-up reflects only the weights pruned and the precision they are stored at.
+"""
+
+import sys
+import os
+import time
+import gc
+import numpy as np
+
+from beam_search import SparseModel, get_model_weights, get_weights_by_feature, load_model, tag_file
+
+PRECISIONS = {"float32": np.float32, "float16": np.float16}
+TIMING_REPEATS = 7
+
+
+def prune_weights(model_weights, classes, threshold, top_m):
+    """
+    Turn {class : {feat:weight...}} into {feat : [(class_id, weight)...]}, keeping only the weights that survive pruning
+    :param model_weights: {class : {feat:weight, feat:weight...}} as returned by get_model_weights
+    :param classes: all POS classes present in MaxEnt model file
+    :param threshold: drop weights whose absolute value is below threshold
+    :param top_m: keep only the top_m weights (by absolute value) per feature; 0 keeps all
+    :return: dictionary of {feat : [(class_id, weight)...]} sorted by class_id; features with no weights left are dropped
+    """
+    by_feature = {}
+    for feat, class_weights in get_weights_by_feature(model_weights, classes).items():
+        class_weights = [cw for cw in class_weights if abs(cw[1]) >= threshold]
+        if top_m > 0:
+            class_weights = sorted(class_weights, key=lambda cw: abs(cw[1]), reverse=True)[:top_m]
+        if class_weights:
+            by_feature[feat] = sorted(class_weights)
+    return by_feature
+
+
+def write_compressed_model(file_name, by_feature, model_weights, classes, precision):
+    """
+    Write pruned weights in sparse feature x class layout (see beam_search.SparseModel)
+    :param file_name: output .npz file
+    :param by_feature: {feat : [(class_id, weight)...]} as returned by prune_weights
+    :param model_weights: full model, used for the <default> weights
+    :param classes: all POS classes present in MaxEnt model file
+    :param precision: numpy dtype to store the feature weights as
+    :return: number of non-zero weights that became 0 at the given precision
+    :raises ValueError: if any weight overflows its stored precision
+    """
+    defaults = [model_weights[cla]["<default>"] for cla in classes]
+    model = SparseModel.from_weights(by_feature, defaults, classes, precision)
+    with np.errstate(over="ignore"):  # overflow is checked for below
+        stored_defaults = model.defaults.astype(np.float32)
+
+    # weights too large for the precision overflow to +-inf, which would make every probability nan when decoding
+    for field, array in (("<default>", stored_defaults), ("feature", model.values)):
+        overflowed = np.count_nonzero(~np.isfinite(array))
+        if overflowed:
+            raise ValueError("{} {} weights out of range for {}".format(overflowed, field, array.dtype.name))
+
+    model.save(file_name)
+
+    # weights too small for the precision are stored as 0
+    zero_weights = sum(1 for class_weights in by_feature.values() for _, weight in class_weights if weight == 0)
+    return int(np.count_nonzero(model.values == 0)) - zero_weights
+
+
+def time_load(model_file):
+    """
+    Load a model and return (model, load time)
+    """
+    start = time.perf_counter()
+    model = load_model(model_file)
+    return model, time.perf_counter() - start
+
+
+def time_decode(model, test_file, boundary_file, beam_size, n, top_k):
+    """
+    Tag the test file with an already loaded model and return (accuracy, decode time)
+    Garbage collection is turned off while timing, as timeit does
+    """
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        accuracy = tag_file(test_file, boundary_file, model, None, beam_size, n, top_k)
+        return accuracy, time.perf_counter() - start
+    finally:
+        gc.enable()
+
+
+def compare_models(model_files, test_file, boundary_file, beam_size, n, top_k):
+    """
+    Load and decode with each model TIMING_REPEATS times, alternating between models so that drift in machine load
+    affects them equally. An untimed decode per model comes first to warm up caches and read the test files into memory.
+    Every model goes through load_model, so text and .npz files are decoded from the same in-memory layout.
+    :param model_files: list of model files to compare
+    :return: list of (median load time, accuracy, median decode time, decode spread), one per model file,
+        where decode spread is (slowest - fastest) / median decode time
+    """
+    models = [load_model(model_file) for model_file in model_files]
+    accuracies = [time_decode(model, test_file, boundary_file, beam_size, n, top_k)[0] for model in models]
+
+    load_times = [[] for _ in model_files]
+    for _ in range(TIMING_REPEATS):
+        for i, model_file in enumerate(model_files):
+            load_times[i].append(time_load(model_file)[1])
+
+    decode_times = [[] for _ in model_files]
+    for _ in range(TIMING_REPEATS):
+        for i, model in enumerate(models):
+            decode_times[i].append(time_decode(model, test_file, boundary_file, beam_size, n, top_k)[1])
+
+    results = []
+    for i in range(len(model_files)):
+        decode_time = np.median(decode_times[i])
+        spread = (max(decode_times[i]) - min(decode_times[i])) / decode_time
+        results.append((np.median(load_times[i]), accuracies[i], decode_time, spread))
+    return results
+
+
+def main():
+    model_file = sys.argv[1]
+    compressed_file = sys.argv[2]
+    if not compressed_file.endswith(".npz"):
+        compressed_file += ".npz"
+    threshold = float(sys.argv[3])
+    top_m = int(sys.argv[4])
+    if sys.argv[5] not in PRECISIONS:
+        sys.exit("precision must be one of: " + ", ".join(PRECISIONS))
+    precision = PRECISIONS[sys.argv[5]]
+    test_file = sys.argv[6]
+    boundary_file = sys.argv[7]
+    beam_size = int(sys.argv[8])
+    n = int(sys.argv[9])
+    top_k = int(sys.argv[10])
+
+    # compress
+    model_weights, classes = get_model_weights(model_file)
+    total_weights = sum(len(model_weights[cla]) - 1 for cla in classes)  # not counting <default>
+    by_feature = prune_weights(model_weights, classes, threshold, top_m)
+    kept_weights = sum(len(class_weights) for class_weights in by_feature.values())
+    try:
+        underflowed = write_compressed_model(compressed_file, by_feature, model_weights, classes, precision)
+    except ValueError as e:
+        sys.exit(e)
+
+    # compare full and compressed models
+    (full_load, full_acc, full_decode, full_spread), (comp_load, comp_acc, comp_decode, comp_spread) = compare_models(
+        [model_file, compressed_file], test_file, boundary_file, beam_size, n, top_k)
+
+    print("weights kept: {} / {} ({:.2%})".format(kept_weights, total_weights, kept_weights / max(total_weights, 1)))
+    if underflowed:
+        print("weights rounded to 0 at {}: {}".format(sys.argv[5], underflowed))
+    print("{:<12} {:>12} {:>10} {:>10} {:>10} {:>8}".format("model", "size (B)", "load (s)", "accuracy",
+                                                            "decode (s)", "spread"))
+    print("{:<12} {:>12} {:>10.3f} {:>10.5f} {:>10.3f} {:>8.1%}".format("full", os.path.getsize(model_file),
+                                                                       full_load, full_acc, full_decode, full_spread))
+    print("{:<12} {:>12} {:>10.3f} {:>10.5f} {:>10.3f} {:>8.1%}".format("compressed", os.path.getsize(compressed_file),
+                                                                       comp_load, comp_acc, comp_decode, comp_spread))
+    print("accuracy change: {:+.5f}".format(comp_acc - full_acc))
+    print("decode speed-up: {:.2f}x".format(full_decode / comp_decode))
+
+
+if __name__ == "__main__":
+    main()